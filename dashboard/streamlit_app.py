@@ -12,6 +12,7 @@ import os
 # Add parent directory to path to import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.data_fetcher import create_session
 from src.portfolio_analyzer import PortfolioAnalyzer
 from src.portfolio_chat import PortfolioChatAssistant
 
@@ -22,6 +23,49 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_yf_session():
+    """Shared HTTP session so market data requests reuse warm connections"""
+    return create_session()
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def compute_report(holdings_key, period):
+    """
+    Load market data and run the full analysis, cached per holdings and period
+    
+    Args:
+        holdings_key (tuple): Hashable snapshot of the holdings from holdings_cache_key()
+        period (str): Time period for historical data
+    
+    Returns:
+        tuple: (portfolio report, rebalancing recommendations)
+    
+    Raises:
+        ValueError: If market data failed to load. Raised rather than returned
+            so st.cache_data doesn't cache the failure.
+    """
+    analyzer = PortfolioAnalyzer(session=get_yf_session())
+    for ticker, shares, purchase_price in holdings_key:
+        analyzer.add_holding(ticker, shares, purchase_price)
+    
+    if not analyzer.load_portfolio_data(period):
+        raise ValueError("Failed to load market data for the portfolio")
+    
+    report = analyzer.generate_portfolio_report()
+    rebalancing = analyzer.get_rebalancing_recommendations(portfolio_value=report['valuation'])
+    
+    return report, rebalancing
+
+
+def holdings_cache_key(holdings):
+    """Build a hashable cache key from the analyzer's holdings dict"""
+    return tuple(sorted(
+        (ticker, holding['shares'], holding['purchase_price'])
+        for ticker, holding in holdings.items()
+    ))
+
+
 # Initialize session state
 if 'analyzer' not in st.session_state:
     st.session_state.analyzer = PortfolioAnalyzer()
@@ -55,6 +99,8 @@ if input_method == "Manual Entry":
         
         if submitted and ticker and shares > 0:
             st.session_state.analyzer.add_holding(ticker, shares, purchase_price)
+            # The shown report no longer matches the holdings
+            st.session_state.data_loaded = False
             st.sidebar.success(f"Added {shares} shares of {ticker}")
 
 else:
@@ -66,6 +112,7 @@ else:
         st.session_state.analyzer.add_holding('GOOGL', 5, 120.00)
         st.session_state.analyzer.add_holding('AMZN', 8, 130.00)
         st.session_state.analyzer.add_holding('TSLA', 12, 200.00)
+        st.session_state.data_loaded = False
         st.sidebar.success("Sample portfolio loaded!")
 
 # Display current holdings
@@ -92,17 +139,48 @@ if st.sidebar.button("🔄 Analyze Portfolio", type="primary"):
         st.sidebar.error("Please add holdings first!")
     else:
         with st.spinner("Loading market data and calculating metrics..."):
-            if st.session_state.analyzer.load_portfolio_data(analysis_period):
+            try:
+                results = compute_report(
+                    holdings_cache_key(st.session_state.analyzer.holdings),
+                    analysis_period
+                )
+            except ValueError:
+                results = None
+            
+            if results:
+                st.session_state.report, st.session_state.rebalancing = results
                 st.session_state.data_loaded = True
                 st.sidebar.success("Analysis complete!")
             else:
+                st.session_state.data_loaded = False
                 st.sidebar.error("Failed to load data. Check ticker symbols.")
 
-# Main dashboard
-if st.session_state.data_loaded:
-    # Generate report
-    report = st.session_state.analyzer.generate_portfolio_report()
-    
+
+@st.cache_data(show_spinner=False)
+def build_pie(labels, values, title):
+    """
+    Build a donut chart, cached so reruns reuse the serialized figure
+    
+    Args:
+        labels (tuple): Slice labels
+        values (tuple): Slice values
+        title (str): Chart title
+    
+    Returns:
+        go.Figure: Pie chart figure
+    """
+    fig = go.Figure(data=[go.Pie(
+        labels=list(labels),
+        values=list(values),
+        hole=0.3
+    )])
+    fig.update_layout(title=title)
+    return fig
+
+
+@st.fragment
+def render_dashboard(report, rebalancing):
+    """Render the analysis sections; isolated so chat reruns don't redraw them"""
     # Key Metrics Row
     st.header("📈 Portfolio Overview")
     
@@ -152,23 +230,21 @@ if st.session_state.data_loaded:
     with col1:
         # Position allocation pie chart
         positions = report['valuation']['positions']
-        fig_pie = go.Figure(data=[go.Pie(
-            labels=list(positions.keys()),
-            values=[pos['position_value'] for pos in positions.values()],
-            hole=0.3
-        )])
-        fig_pie.update_layout(title="Position Allocation")
+        fig_pie = build_pie(
+            tuple(positions.keys()),
+            tuple(pos['position_value'] for pos in positions.values()),
+            "Position Allocation"
+        )
         st.plotly_chart(fig_pie, use_container_width=True)
     
     with col2:
         # Sector allocation
         if report['diversification']['sector_allocation']:
-            fig_sector = go.Figure(data=[go.Pie(
-                labels=list(report['diversification']['sector_allocation'].keys()),
-                values=list(report['diversification']['sector_allocation'].values()),
-                hole=0.3
-            )])
-            fig_sector.update_layout(title="Sector Allocation")
+            fig_sector = build_pie(
+                tuple(report['diversification']['sector_allocation'].keys()),
+                tuple(report['diversification']['sector_allocation'].values()),
+                "Sector Allocation"
+            )
             st.plotly_chart(fig_sector, use_container_width=True)
     
     # Holdings Table
@@ -242,8 +318,6 @@ if st.session_state.data_loaded:
     # Rebalancing Recommendations
     st.header("⚖️ Rebalancing Recommendations")
     
-    rebalancing = st.session_state.analyzer.get_rebalancing_recommendations()
-    
     rebal_data = []
     for ticker, rec in rebalancing.items():
         if abs(rec['difference_pct']) > 0.02:  # Only show if >2% difference
@@ -297,7 +371,11 @@ if st.session_state.data_loaded:
     
     if report['diversification']['top_3_weight'] > 0.70:
         st.warning("⚠️ Top 3 positions exceed 70% of portfolio. Increase diversification.")
-    
+
+
+@st.fragment
+def render_chat(report):
+    """Render the AI chat assistant; chat input only reruns this fragment"""
     # AI Chat Assistant
     st.header("💬 AI Financial Advisor")
     
@@ -352,21 +430,19 @@ if st.session_state.data_loaded:
             # Display user message
             st.chat_message("user").write(user_question)
             
-            # Get AI response with portfolio context
-            with st.spinner("Thinking..."):
-                response = st.session_state.chat_assistant.chat(
-                    user_question, 
+            # Stream AI response with portfolio context as it is generated
+            response = st.chat_message("assistant").write_stream(
+                st.session_state.chat_assistant.chat_stream(
+                    user_question,
                     portfolio_context
                 )
+            )
             
             # Add assistant response to history
             st.session_state.chat_history.append({
                 'role': 'assistant',
                 'content': response
             })
-            
-            # Display assistant response
-            st.chat_message("assistant").write(response)
         
         # Clear chat button
         if st.button("Clear Chat History"):
@@ -374,6 +450,11 @@ if st.session_state.data_loaded:
             st.session_state.chat_history = []
             st.rerun()
 
+
+# Main dashboard
+if st.session_state.data_loaded:
+    render_dashboard(st.session_state.report, st.session_state.rebalancing)
+    render_chat(st.session_state.report)
 else:
     # Welcome screen
     st.info("👈 Add your holdings in the sidebar and click 'Analyze Portfolio' to get started!")
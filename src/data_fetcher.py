@@ -3,15 +3,95 @@ Data Fetcher Module
 Fetches historical stock data using yfinance API
 """
 
+import asyncio
+import os
+import tempfile
+import time
+import httpx
+import requests
 import yfinance as yf
+import numpy as np
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from pathlib import Path
+
+# Upper bound on concurrent requests to Yahoo Finance
+MAX_WORKERS = 16
+
+# Seconds a fetched current price is reused before hitting the API again
+PRICE_CACHE_TTL = 60
+
+# On-disk price history cache, one parquet file per (ticker, period)
+HISTORY_CACHE_DIR = Path('~/.cache/portfolio').expanduser()
+
+# Seconds a cached history file is served before re-downloading. Kept short
+# because the last cached close doubles as the current price in valuations
+HISTORY_CACHE_MAX_AGE = 15 * 60
+
+# Connection pool size; kept >= MAX_WORKERS so pooled threads don't churn sockets
+POOL_SIZE = 32
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+
+
+def create_session():
+    """
+    Create an HTTP session for sharing connections across yfinance calls
+    
+    Returns:
+        requests.Session: Session with a pooled HTTPS adapter
+    """
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT})
+    
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    
+    return session
+
+
+def _strip_timezone(data):
+    """
+    Drop the timezone from a price history index, keeping exchange-local dates
+    
+    Ticker.history() returns a tz-aware index and yf.download() a tz-naive one;
+    normalizing both lets frames from either source (or the cache) be aligned.
+    
+    Args:
+        data (pd.DataFrame): Historical stock data
+    
+    Returns:
+        pd.DataFrame: The same data with a tz-naive index
+    """
+    if getattr(data.index, 'tz', None) is not None:
+        data = data.tz_localize(None)
+    
+    return data
+
 
 class StockDataFetcher:
     """Fetches and processes stock market data"""
     
-    def __init__(self):
+    def __init__(self, session=None, cache_dir=HISTORY_CACHE_DIR, async_download=False):
+        """
+        Initialize data fetcher
+        
+        Args:
+            session (requests.Session): Shared HTTP session. If None, one is created
+            cache_dir (Path): Directory for cached price history. If None, caching is disabled
+            async_download (bool): Download portfolio history with AsyncStockDataFetcher
+                (one concurrent chart-API request per ticker) instead of yf.download
+        """
         self.data = None
+        self.session = session if session is not None else create_session()
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.async_download = async_download
+        self._price_cache = {}  # ticker -> (price, fetch timestamp)
+        self._info_cache = {}   # ticker -> stock info dict
     
     def fetch_stock_data(self, ticker, period='1y'):
         """
@@ -24,14 +104,20 @@ class StockDataFetcher:
         Returns:
             pd.DataFrame: Historical stock data with OHLCV columns
         """
+        cached = self._read_cached_history(ticker, period)
+        if cached is not None:
+            return cached
+        
         try:
-            stock = yf.Ticker(ticker)
+            stock = yf.Ticker(ticker, session=self.session)
             data = stock.history(period=period)
             
             if data.empty:
                 print(f"Warning: No data found for {ticker}")
                 return None
             
+            data = _strip_timezone(data)
+            self._write_cached_history(ticker, period, data)
             return data
         
         except Exception as e:
@@ -42,6 +128,33 @@ class StockDataFetcher:
         """
         Fetch data for multiple stocks (portfolio)
         
+        Args:
+            tickers (list): List of ticker symbols
+            period (str): Time period for historical data
+        
+        Returns:
+            dict: Dictionary with ticker as key and DataFrame as value
+        """
+        if not tickers:
+            return {}
+        
+        # Serve what we can from the on-disk cache
+        portfolio_data = {}
+        for ticker in tickers:
+            cached = self._read_cached_history(ticker, period)
+            if cached is not None:
+                portfolio_data[ticker] = cached
+        
+        to_fetch = [ticker for ticker in tickers if ticker not in portfolio_data]
+        if to_fetch:
+            portfolio_data.update(self._download_portfolio_data(to_fetch, period))
+        
+        return {ticker: portfolio_data[ticker] for ticker in tickers if ticker in portfolio_data}
+    
+    def _download_portfolio_data(self, tickers, period='1y'):
+        """
+        Download history for several tickers in one batched request
+        
         Args:
             tickers (list): List of ticker symbols
             period (str): Time period for historical data
@@ -51,15 +164,173 @@ class StockDataFetcher:
         """
         portfolio_data = {}
         
+        print(f"Fetching data for {', '.join(tickers)}...")
+        
+        if self.async_download:
+            try:
+                portfolio_data = AsyncStockDataFetcher().fetch_portfolio_data(tickers, period)
+            except Exception as e:
+                print(f"Async download failed ({str(e)}), fetching tickers individually...")
+                return self._fetch_portfolio_data_per_ticker(tickers, period)
+            
+            for ticker, ticker_data in portfolio_data.items():
+                self._write_cached_history(ticker, period, ticker_data)
+            
+            # Retry tickers the chart API rejected through yfinance
+            missing = [ticker for ticker in tickers if ticker not in portfolio_data]
+            if missing:
+                portfolio_data.update(self._fetch_portfolio_data_per_ticker(missing, period))
+            
+            return portfolio_data
+        
+        try:
+            # One batched request for all tickers instead of one per ticker.
+            # auto_adjust=True keeps 'Close' consistent with Ticker.history()
+            data = yf.download(
+                tickers,
+                period=period,
+                group_by='ticker',
+                threads=True,
+                auto_adjust=True,
+                progress=False,
+                session=self.session
+            )
+        except Exception as e:
+            print(f"Batch download failed ({str(e)}), fetching tickers individually...")
+            return self._fetch_portfolio_data_per_ticker(tickers, period)
+        
         for ticker in tickers:
-            print(f"Fetching data for {ticker}...")
-            data = self.fetch_stock_data(ticker, period)
+            # Single-ticker downloads may come back without the ticker level
+            if isinstance(data.columns, pd.MultiIndex):
+                if ticker not in data.columns.get_level_values(0):
+                    print(f"Warning: No data found for {ticker}")
+                    continue
+                ticker_data = data[ticker]
+            else:
+                ticker_data = data
+            
+            ticker_data = _strip_timezone(ticker_data.dropna(how='all'))
             
-            if data is not None:
-                portfolio_data[ticker] = data
+            if ticker_data.empty:
+                print(f"Warning: No data found for {ticker}")
+                continue
+            
+            self._write_cached_history(ticker, period, ticker_data)
+            portfolio_data[ticker] = ticker_data
         
         return portfolio_data
     
+    def _fetch_portfolio_data_per_ticker(self, tickers, period='1y'):
+        """
+        Fetch portfolio data with one request per ticker (fallback for batch download)
+        
+        Args:
+            tickers (list): List of ticker symbols
+            period (str): Time period for historical data
+        
+        Returns:
+            dict: Dictionary with ticker as key and DataFrame as value
+        """
+        results = self._map_tickers(
+            lambda ticker: self.fetch_stock_data(ticker, period),
+            tickers
+        )
+        
+        return {ticker: data for ticker, data in results.items() if data is not None}
+    
+    def _history_cache_path(self, ticker, period):
+        """Path of the cached history file for a ticker and period"""
+        return self.cache_dir / f"{ticker}_{period}.parquet"
+    
+    def _read_cached_history(self, ticker, period):
+        """
+        Read cached price history if it exists and is still fresh
+        
+        Args:
+            ticker (str): Stock ticker symbol
+            period (str): Time period for historical data
+        
+        Returns:
+            pd.DataFrame: Cached history, or None on a miss
+        """
+        if self.cache_dir is None:
+            return None
+        
+        path = self._history_cache_path(ticker, period)
+        tmp_path = None
+        
+        try:
+            if time.time() - path.stat().st_mtime < HISTORY_CACHE_MAX_AGE:
+                # Files written before the index was normalized may be tz-aware
+                return _strip_timezone(pd.read_parquet(path, engine='pyarrow'))
+        except (OSError, ValueError):
+            # Missing or unreadable cache file - treat as a miss
+            pass
+        
+        return None
+    
+    def _write_cached_history(self, ticker, period, data):
+        """
+        Write price history to the on-disk cache
+        
+        Args:
+            ticker (str): Stock ticker symbol
+            period (str): Time period for historical data
+            data (pd.DataFrame): Historical stock data
+        """
+        if self.cache_dir is None:
+            return
+        
+        path = self._history_cache_path(ticker, period)
+        tmp_path = None
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            
+            # Write to a unique temp file and swap it in, so concurrent sessions
+            # never write or read a half-written file
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=path.name + '.',
+                                             suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                data.to_parquet(f, engine='pyarrow')
+            
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Warning: Could not cache data for {ticker}: {str(e)}")
+            
+            # Don't leave a partial temp file behind
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    def _map_tickers(self, func, tickers):
+        """
+        Call a per-ticker fetch function concurrently for several tickers
+        
+        Args:
+            func (callable): Function taking a ticker symbol
+            tickers (list): List of ticker symbols
+        
+        Returns:
+            dict: Dictionary with ticker as key and func(ticker) as value,
+                in the same order as tickers
+        """
+        if not tickers:
+            return {}
+        
+        results = {}
+        
+        # Network calls release the GIL, so threads overlap the round-trips
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(tickers))) as executor:
+            futures = {executor.submit(func, ticker): ticker for ticker in tickers}
+            
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        
+        return {ticker: results[ticker] for ticker in tickers}
+    
     def get_current_price(self, ticker):
         """
         Get current/latest price for a ticker
@@ -70,19 +341,42 @@ class StockDataFetcher:
         Returns:
             float: Current stock price
         """
+        cached = self._price_cache.get(ticker)
+        if cached and time.time() - cached[1] < PRICE_CACHE_TTL:
+            return cached[0]
+        
         try:
-            stock = yf.Ticker(ticker)
+            stock = yf.Ticker(ticker, session=self.session)
             data = stock.history(period='1d')
             
-            if not data.empty:
-                return data['Close'].iloc[-1]
-            else:
+            if data.empty:
+                return None
+            
+            price = data['Close'].iloc[-1]
+            
+            # A missing close is not a price; don't cache it
+            if pd.isna(price):
                 return None
+            
+            self._price_cache[ticker] = (price, time.time())
+            return price
         
         except Exception as e:
             print(f"Error getting current price for {ticker}: {str(e)}")
             return None
     
+    def get_current_prices(self, tickers):
+        """
+        Get current/latest prices for several tickers concurrently
+        
+        Args:
+            tickers (list): List of ticker symbols
+        
+        Returns:
+            dict: Dictionary with ticker as key and current price (or None) as value
+        """
+        return self._map_tickers(self.get_current_price, tickers)
+    
     def get_stock_info(self, ticker):
         """
         Get detailed stock information
@@ -93,21 +387,156 @@ class StockDataFetcher:
         Returns:
             dict: Stock information including sector, industry, market cap
         """
+        # Sector/industry data changes rarely, so keep it for the fetcher's lifetime
+        if ticker in self._info_cache:
+            return self._info_cache[ticker]
+        
         try:
-            stock = yf.Ticker(ticker)
+            stock = yf.Ticker(ticker, session=self.session)
             info = stock.info
             
-            return {
+            self._info_cache[ticker] = {
                 'name': info.get('longName', 'N/A'),
                 'sector': info.get('sector', 'N/A'),
                 'industry': info.get('industry', 'N/A'),
                 'market_cap': info.get('marketCap', 0),
                 'pe_ratio': info.get('trailingPE', 0)
             }
+            
+            return self._info_cache[ticker]
         
         except Exception as e:
             print(f"Error getting info for {ticker}: {str(e)}")
             return None
+    
+    def get_stocks_info(self, tickers):
+        """
+        Get detailed stock information for several tickers concurrently
+        
+        Args:
+            tickers (list): List of ticker symbols
+        
+        Returns:
+            dict: Dictionary with ticker as key and info dict (or None) as value
+        """
+        return self._map_tickers(self.get_stock_info, tickers)
+
+
+class AsyncStockDataFetcher:
+    """Fetches portfolio price history concurrently from Yahoo's chart API"""
+    
+    CHART_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/{ticker}'
+    
+    def __init__(self, max_connections=POOL_SIZE):
+        """
+        Initialize async data fetcher
+        
+        Args:
+            max_connections (int): Maximum simultaneous connections to Yahoo
+        """
+        self.max_connections = max_connections
+    
+    async def fetch_portfolio_data_async(self, tickers, period='1y'):
+        """
+        Fetch data for multiple stocks with all requests in flight at once
+        
+        Args:
+            tickers (list): List of ticker symbols
+            period (str): Time period for historical data
+        
+        Returns:
+            dict: Dictionary with ticker as key and DataFrame as value
+        """
+        limits = httpx.Limits(max_connections=self.max_connections)
+        
+        async with httpx.AsyncClient(http2=True, limits=limits, timeout=10.0,
+                                     headers={'User-Agent': USER_AGENT}) as client:
+            results = await asyncio.gather(
+                *(self._fetch_one(client, ticker, period) for ticker in tickers)
+            )
+        
+        return {ticker: data for ticker, data in zip(tickers, results) if data is not None}
+    
+    def fetch_portfolio_data(self, tickers, period='1y'):
+        """
+        Synchronous wrapper around fetch_portfolio_data_async
+        
+        Args:
+            tickers (list): List of ticker symbols
+            period (str): Time period for historical data
+        
+        Returns:
+            dict: Dictionary with ticker as key and DataFrame as value
+        """
+        return asyncio.run(self.fetch_portfolio_data_async(tickers, period))
+    
+    async def _fetch_one(self, client, ticker, period):
+        """
+        Fetch and parse daily history for a single ticker
+        
+        Args:
+            client (httpx.AsyncClient): Shared async HTTP client
+            ticker (str): Stock ticker symbol
+            period (str): Time period for historical data
+        
+        Returns:
+            pd.DataFrame: Historical stock data with OHLCV columns, or None
+        """
+        try:
+            response = await client.get(
+                self.CHART_URL.format(ticker=ticker),
+                params={'range': period, 'interval': '1d', 'includeAdjustedClose': 'true'}
+            )
+            response.raise_for_status()
+            
+            data = self._parse_chart(response.json())
+            
+            if data.empty:
+                print(f"Warning: No data found for {ticker}")
+                return None
+            
+            return data
+        
+        except Exception as e:
+            print(f"Error fetching data for {ticker}: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _parse_chart(payload):
+        """
+        Convert a chart API response into an OHLCV DataFrame
+        
+        Prices are split/dividend adjusted the same way as Ticker.history()
+        
+        Args:
+            payload (dict): Decoded chart API JSON
+        
+        Returns:
+            pd.DataFrame: Historical stock data with OHLCV columns
+        """
+        result = payload['chart']['result'][0]
+        quote = result['indicators']['quote'][0]
+        
+        # Exchange-local trading dates, tz-naive like yf.download() and the cache
+        index = pd.to_datetime(result['timestamp'], unit='s', utc=True)
+        index = index.tz_convert(result['meta']['exchangeTimezoneName'])
+        index = index.tz_localize(None).normalize().rename('Date')
+        
+        data = pd.DataFrame({
+            'Open': np.array(quote['open'], dtype=np.float64),
+            'High': np.array(quote['high'], dtype=np.float64),
+            'Low': np.array(quote['low'], dtype=np.float64),
+            'Close': np.array(quote['close'], dtype=np.float64),
+            'Volume': np.array(quote['volume'], dtype=np.float64)
+        }, index=index)
+        
+        # Scale OHLC by the adjusted/raw close ratio
+        adjclose = result['indicators'].get('adjclose')
+        if adjclose:
+            ratio = np.array(adjclose[0]['adjclose'], dtype=np.float64) / data['Close']
+            data[['Open', 'High', 'Low', 'Close']] = data[['Open', 'High', 'Low', 'Close']].mul(ratio, axis=0)
+        
+        return data.dropna(how='all')
 
 
 # Test function
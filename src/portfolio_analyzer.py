@@ -3,25 +3,109 @@ Portfolio Analyzer Module
 Main analysis engine that combines data fetching and risk calculations
 """
 
+import json
+import os
+import tempfile
 import pandas as pd
 import numpy as np
-from src.data_fetcher import StockDataFetcher
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from src.data_fetcher import StockDataFetcher, MAX_WORKERS
 from src.risk_calculator import RiskCalculator
 
+# Persistent {ticker: sector} map so sectors are only looked up once per ticker
+SECTOR_CACHE_PATH = Path('~/.cache/portfolio_sectors.json').expanduser()
+
+# Sector reported by get_stock_info() when Yahoo has none; shown but never persisted
+UNKNOWN_SECTOR = 'N/A'
+
 class PortfolioAnalyzer:
     """Main portfolio analysis class"""
     
-    def __init__(self, risk_free_rate=0.04):
+    def __init__(self, risk_free_rate=0.04, session=None, async_download=False):
         """
         Initialize portfolio analyzer
         
         Args:
             risk_free_rate (float): Annual risk-free rate
+            session (requests.Session): Shared HTTP session for market data requests
+            async_download (bool): Download history with concurrent chart-API requests
+                instead of yf.download (see StockDataFetcher)
         """
-        self.fetcher = StockDataFetcher()
+        self.fetcher = StockDataFetcher(session, async_download=async_download)
         self.calculator = RiskCalculator(risk_free_rate)
         self.portfolio_data = {}
         self.holdings = {}
+        # Loaded Close prices aligned into one (dates x tickers) matrix
+        self._closes = None
+        self._closes_np = None
+        self._tickers = []
+        self._sector_cache_path = SECTOR_CACHE_PATH
+        self._sector_cache = self._load_sector_cache()
+        self._sector_lookup_failed = set()  # tickers whose lookup failed since the last load
+    
+    def _load_sector_cache(self):
+        """
+        Load the persisted ticker-to-sector map
+        
+        Returns:
+            dict: {ticker: sector}, empty if the cache file is missing or unreadable
+        """
+        try:
+            with open(self._sector_cache_path) as f:
+                sectors = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        
+        # Older files may hold unknown sectors; look those up again
+        return {ticker: sector for ticker, sector in sectors.items() if sector != UNKNOWN_SECTOR}
+    
+    def _save_sector_cache(self):
+        """Persist the ticker-to-sector map (atomically, as other sessions may share it)"""
+        sectors = {
+            ticker: sector for ticker, sector in self._sector_cache.items()
+            if sector != UNKNOWN_SECTOR
+        }
+        
+        try:
+            self._sector_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            # Unique temp file per write: sessions may be threads of one process
+            with tempfile.NamedTemporaryFile('w', dir=self._sector_cache_path.parent,
+                                             prefix=self._sector_cache_path.name + '.',
+                                             suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                json.dump(sectors, f, indent=2, sort_keys=True)
+            
+            os.replace(tmp_path, self._sector_cache_path)
+        except OSError as e:
+            print(f"Warning: Could not save sector cache: {str(e)}")
+    
+    def _update_sector_cache(self, stocks_info):
+        """
+        Record sectors from fetched stock info and persist any new entries
+        
+        Args:
+            stocks_info (dict): {ticker: info dict or None} as returned by get_stocks_info()
+        """
+        updated = False
+        for ticker, info in stocks_info.items():
+            sector = info.get('sector') if info else None
+            
+            if sector is None:
+                self._sector_lookup_failed.add(ticker)
+                continue
+            
+            self._sector_cache[ticker] = sector
+            
+            if sector == UNKNOWN_SECTOR:
+                # Counted as unknown for now, but looked up again on the next load
+                self._sector_lookup_failed.add(ticker)
+            else:
+                updated = True
+        
+        if updated:
+            self._save_sector_cache()
     
     def add_holding(self, ticker, shares, purchase_price=None):
         """
@@ -37,6 +121,19 @@ class PortfolioAnalyzer:
             'purchase_price': purchase_price
         }
     
+    def _missing_sector_tickers(self):
+        """
+        Holdings that still need a sector lookup
+        
+        Returns:
+            list: Tickers without a known sector that have not failed since the last load
+        """
+        return [
+            ticker for ticker in self.holdings.keys()
+            if self._sector_cache.get(ticker, UNKNOWN_SECTOR) == UNKNOWN_SECTOR
+            and ticker not in self._sector_lookup_failed
+        ]
+    
     def load_portfolio_data(self, period='1y'):
         """
         Load historical data for all holdings
@@ -54,10 +151,41 @@ class PortfolioAnalyzer:
             return False
         
         print(f"Loading data for {len(tickers)} stocks...")
-        self.portfolio_data = self.fetcher.fetch_portfolio_data(tickers, period)
+        
+        # Fetch history and any unknown sectors in one wave of requests
+        self._sector_lookup_failed = set()
+        missing_sectors = self._missing_sector_tickers()
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            history_future = executor.submit(self.fetcher.fetch_portfolio_data, tickers, period)
+            info_futures = {
+                ticker: executor.submit(self.fetcher.get_stock_info, ticker)
+                for ticker in missing_sectors
+            }
+            
+            self.portfolio_data = history_future.result()
+            stocks_info = {ticker: future.result() for ticker, future in info_futures.items()}
+        
+        self._update_sector_cache(stocks_info)
+        self._align_closes()
         
         return len(self.portfolio_data) > 0
     
+    def _align_closes(self):
+        """Stack the loaded Close series into one aligned price matrix for downstream math"""
+        if not self.portfolio_data:
+            self._closes = None
+            self._closes_np = None
+            self._tickers = []
+            return
+        
+        self._closes = pd.concat(
+            {ticker: data['Close'] for ticker, data in self.portfolio_data.items()},
+            axis=1
+        ).ffill().dropna()
+        self._closes_np = self._closes.to_numpy(dtype=np.float64)
+        self._tickers = list(self._closes.columns)
+    
     def calculate_portfolio_value(self):
         """
         Calculate current portfolio value and individual positions
@@ -65,62 +193,75 @@ class PortfolioAnalyzer:
         Returns:
             dict: Portfolio valuation details
         """
-        total_value = 0
-        positions = {}
+        # Latest close from the loaded history; only fetch tickers not loaded yet
+        current_prices = {}
+        if self._closes_np is not None and len(self._closes_np):
+            current_prices = dict(zip(self._tickers, self._closes_np[-1]))
+        
+        missing = [ticker for ticker in self.holdings.keys() if ticker not in current_prices]
+        current_prices.update(self.fetcher.get_current_prices(missing))
+        
+        # Holdings without a price are left out of the valuation
+        tickers = [ticker for ticker in self.holdings.keys() if current_prices[ticker]]
+        
+        shares = np.array([self.holdings[t]['shares'] for t in tickers], dtype=np.float64)
+        prices = np.array([current_prices[t] for t in tickers], dtype=np.float64)
+        # NaN marks holdings without a purchase price (no gain/loss)
+        purchase_prices = np.array(
+            [self.holdings[t]['purchase_price'] or np.nan for t in tickers],
+            dtype=np.float64
+        )
         
-        for ticker, holding in self.holdings.items():
-            current_price = self.fetcher.get_current_price(ticker)
+        # Values, weights and gains for all positions at once
+        position_values = shares * prices
+        total_value = position_values.sum()
+        weights = position_values / total_value
+        gains = (prices - purchase_prices) * shares
+        gain_pcts = (prices / purchase_prices - 1) * 100
+        
+        positions = {}
+        for i, ticker in enumerate(tickers):
+            has_cost_basis = not np.isnan(purchase_prices[i])
             
-            if current_price:
-                position_value = current_price * holding['shares']
-                total_value += position_value
-                
-                # Calculate gain/loss if purchase price provided
-                gain_loss = None
-                gain_loss_pct = None
-                if holding['purchase_price']:
-                    gain_loss = (current_price - holding['purchase_price']) * holding['shares']
-                    gain_loss_pct = ((current_price / holding['purchase_price']) - 1) * 100
-                
-                positions[ticker] = {
-                    'shares': holding['shares'],
-                    'current_price': current_price,
-                    'position_value': position_value,
-                    'purchase_price': holding['purchase_price'],
-                    'gain_loss': gain_loss,
-                    'gain_loss_pct': gain_loss_pct
-                }
-        
-        # Calculate weights
-        for ticker in positions:
-            positions[ticker]['weight'] = positions[ticker]['position_value'] / total_value
+            positions[ticker] = {
+                'shares': self.holdings[ticker]['shares'],
+                'current_price': prices[i],
+                'position_value': position_values[i],
+                'purchase_price': self.holdings[ticker]['purchase_price'],
+                'gain_loss': gains[i] if has_cost_basis else None,
+                'gain_loss_pct': gain_pcts[i] if has_cost_basis else None,
+                'weight': weights[i]
+            }
         
         return {
             'total_value': total_value,
             'positions': positions
         }
     
-    def analyze_diversification(self):
+    def analyze_diversification(self, portfolio_value=None):
         """
         Analyze portfolio diversification by sector and concentration
         
+        Args:
+            portfolio_value (dict): Precomputed result of calculate_portfolio_value().
+                If None, the valuation is calculated
+        
         Returns:
             dict: Diversification analysis
         """
         sectors = {}
-        portfolio_value = self.calculate_portfolio_value()
+        if portfolio_value is None:
+            portfolio_value = self.calculate_portfolio_value()
         
-        for ticker in self.holdings.keys():
-            info = self.fetcher.get_stock_info(ticker)
-            
-            if info and 'sector' in info:
-                sector = info['sector']
-                position_value = portfolio_value['positions'][ticker]['position_value']
-                
-                if sector in sectors:
-                    sectors[sector] += position_value
-                else:
-                    sectors[sector] = position_value
+        # Resolve sectors from the cache; only look up tickers not tried yet
+        missing = self._missing_sector_tickers()
+        if missing:
+            self._update_sector_cache(self.fetcher.get_stocks_info(missing))
+        
+        for ticker, position in portfolio_value['positions'].items():
+            sector = self._sector_cache.get(ticker)
+            if sector is not None:
+                sectors[sector] = sectors.get(sector, 0) + position['position_value']
         
         # Calculate sector weights
         total_value = portfolio_value['total_value']
@@ -131,10 +272,14 @@ class PortfolioAnalyzer:
         num_sectors = len(sectors)
         
         # Check concentration (if any position > 40% or top 3 > 70%, reduce score)
-        sorted_weights = sorted([p['weight'] for p in portfolio_value['positions'].values()], 
-                               reverse=True)
-        top_position = sorted_weights[0] if sorted_weights else 0
-        top_3 = sum(sorted_weights[:3]) if len(sorted_weights) >= 3 else sum(sorted_weights)
+        weights = np.fromiter(
+            (p['weight'] for p in portfolio_value['positions'].values()),
+            dtype=np.float64
+        )
+        top_k = min(3, weights.size)
+        top_position = weights.max() if weights.size else 0
+        # Largest 3 weights via partial selection (no full sort)
+        top_3 = np.partition(weights, -top_k)[-top_k:].sum() if top_k else 0
         
         diversification_score = min(10, num_holdings * 0.5 + num_sectors * 1.5)
         
@@ -154,10 +299,14 @@ class PortfolioAnalyzer:
             'diversification_score': round(diversification_score, 1)
         }
     
-    def calculate_risk_metrics(self):
+    def calculate_risk_metrics(self, portfolio_value=None):
         """
         Calculate comprehensive risk metrics for the portfolio
         
+        Args:
+            portfolio_value (dict): Precomputed result of calculate_portfolio_value().
+                If None, the valuation is calculated
+        
         Returns:
             dict: Risk metrics
         """
@@ -166,15 +315,24 @@ class PortfolioAnalyzer:
             return None
         
         # Get portfolio weights
-        portfolio_value = self.calculate_portfolio_value()
+        if portfolio_value is None:
+            portfolio_value = self.calculate_portfolio_value()
         weights = {ticker: pos['weight'] 
                   for ticker, pos in portfolio_value['positions'].items()}
         
+        # Daily returns straight from the aligned price matrix
+        asset_returns = self._closes_np[1:] / self._closes_np[:-1] - 1
+        
+        if len(asset_returns) < 2:
+            print("Not enough price history to calculate risk metrics.")
+            return None
+        
+        # Portfolio returns as a single matrix-vector product
+        weight_vector = np.array([weights.get(ticker, 0) for ticker in self._tickers])
+        portfolio_returns = asset_returns @ weight_vector
+        
         # Calculate portfolio metrics
-        metrics = self.calculator.calculate_portfolio_metrics(
-            self.portfolio_data, 
-            weights
-        )
+        metrics = self.calculator.calculate_portfolio_metrics_vec(portfolio_returns)
         
         # Add risk assessment
         metrics['risk_level'] = self.calculator.assess_risk_level(
@@ -184,45 +342,52 @@ class PortfolioAnalyzer:
         
         return metrics
     
-    def get_rebalancing_recommendations(self, target_weights=None):
+    def get_rebalancing_recommendations(self, target_weights=None, portfolio_value=None):
         """
         Generate rebalancing recommendations
         
         Args:
             target_weights (dict): Target weights {ticker: weight}. If None, equal weights
+            portfolio_value (dict): Precomputed result of calculate_portfolio_value().
+                If None, the valuation is calculated
         
         Returns:
             dict: Rebalancing recommendations
         """
-        portfolio_value = self.calculate_portfolio_value()
-        current_weights = {ticker: pos['weight'] 
-                          for ticker, pos in portfolio_value['positions'].items()}
+        if portfolio_value is None:
+            portfolio_value = self.calculate_portfolio_value()
+        
+        positions = portfolio_value['positions']
+        tickers = list(positions.keys())
+        
+        if not tickers:
+            return {}
+        
+        current_weights = np.array([positions[t]['weight'] for t in tickers], dtype=np.float64)
+        prices = np.array([positions[t]['current_price'] for t in tickers], dtype=np.float64)
         
         # Default to equal weights
         if target_weights is None:
-            target_weights = {ticker: 1/len(self.holdings) 
-                            for ticker in self.holdings.keys()}
+            target = np.full_like(current_weights, 1 / len(tickers))
+        else:
+            target = np.array([target_weights.get(t, 0) for t in tickers], dtype=np.float64)
         
-        recommendations = {}
-        total_value = portfolio_value['total_value']
+        # Trades for all positions at once
+        difference = target - current_weights
+        dollar_difference = difference * portfolio_value['total_value']
+        shares_to_trade = dollar_difference / prices
+        actions = np.where(shares_to_trade > 0, 'BUY',
+                           np.where(shares_to_trade < 0, 'SELL', 'HOLD'))
         
-        for ticker in self.holdings.keys():
-            current_weight = current_weights.get(ticker, 0)
-            target_weight = target_weights.get(ticker, 0)
-            
-            difference = target_weight - current_weight
-            dollar_difference = difference * total_value
-            
-            current_price = portfolio_value['positions'][ticker]['current_price']
-            shares_to_trade = dollar_difference / current_price
-            
+        recommendations = {}
+        for i, ticker in enumerate(tickers):
             recommendations[ticker] = {
-                'current_weight': current_weight,
-                'target_weight': target_weight,
-                'difference_pct': difference,
-                'dollar_difference': dollar_difference,
-                'shares_to_trade': shares_to_trade,
-                'action': 'BUY' if shares_to_trade > 0 else 'SELL' if shares_to_trade < 0 else 'HOLD'
+                'current_weight': current_weights[i],
+                'target_weight': target[i],
+                'difference_pct': difference[i],
+                'dollar_difference': dollar_difference[i],
+                'shares_to_trade': shares_to_trade[i],
+                'action': str(actions[i])
             }
         
         return recommendations
@@ -234,10 +399,12 @@ class PortfolioAnalyzer:
         Returns:
             dict: Complete portfolio report
         """
+        valuation = self.calculate_portfolio_value()
+        
         report = {
-            'valuation': self.calculate_portfolio_value(),
-            'diversification': self.analyze_diversification(),
-            'risk_metrics': self.calculate_risk_metrics(),
+            'valuation': valuation,
+            'diversification': self.analyze_diversification(valuation),
+            'risk_metrics': self.calculate_risk_metrics(valuation),
         }
         
         return report
@@ -3,13 +3,122 @@ Portfolio Chat Assistant using Claude API
 Provides AI-powered financial advice and metric explanations
 """
 
+import asyncio
+import functools
+import hashlib
+import json
 import os
+import re
+import threading
 import anthropic
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 1024
+
+# Retries and per-request timeout (seconds) for API calls
+API_MAX_RETRIES = 2
+API_TIMEOUT = 30.0
+
+BASE_SYSTEM_PROMPT = """You are a professional financial advisor assistant helping retail banking clients understand their investment portfolios. 
+
+Your role:
+- Explain financial metrics in simple, accessible language
+- Provide actionable investment advice based on portfolio data
+- Help users understand risk, diversification, and rebalancing
+- Be encouraging but honest about risks
+- Cite specific numbers from their portfolio when relevant
+
+Keep responses concise (2-3 paragraphs max) unless asked for detailed analysis."""
+
+CONTEXT_PROMPT_TEMPLATE = """Current Portfolio Context:
+- Total Value: ${total_value:,.2f}
+- Risk Level: {risk_level}
+- Sharpe Ratio: {sharpe_ratio}
+- Volatility: {volatility}
+- Diversification Score: {diversification_score}/10
+- Number of Holdings: {num_holdings}
+
+Use this context to provide personalized advice."""
+
+# Cache breakpoints placed in the message history (the API allows 4 in total,
+# one of which is used by the system prompt)
+HISTORY_CACHE_BREAKPOINTS = 2
+
+# Maximum user/assistant turns kept in the conversation history
+MAX_HISTORY_TURNS = 10
+
+# Maximum number of answers kept in the response cache
+RESPONSE_CACHE_SIZE = 256
+
+# Answers to opening questions, shared by all assistants (and so all dashboard
+# sessions): (normalized question, context hash) -> response
+_response_cache = {}
+_response_cache_lock = threading.Lock()
+
+
+def _tokenize(text):
+    """Lowercase word tokens of a message"""
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def _response_cache_key(user_message, portfolio_context):
+    """
+    Response cache key: the normalized question plus a hash of the portfolio context
+    
+    Args:
+        user_message (str): User's question
+        portfolio_context (dict): Current portfolio data
+    
+    Returns:
+        tuple: (normalized question, context hash)
+    """
+    context = json.dumps(portfolio_context or {}, sort_keys=True, default=str)
+    
+    return " ".join(_tokenize(user_message)), hashlib.sha256(context.encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_client(api_key):
+    """
+    Shared Claude API client, so its HTTP connection pool is reused across assistants
+    
+    Args:
+        api_key (str): Anthropic API key
+    
+    Returns:
+        anthropic.Anthropic: API client
+    """
+    return anthropic.Anthropic(
+        api_key=api_key,
+        max_retries=API_MAX_RETRIES,
+        timeout=API_TIMEOUT
+    )
+
+
+def _format_context(portfolio_context):
+    """
+    Fill the portfolio context prompt from current portfolio metrics
+    
+    Args:
+        portfolio_context (dict): Current portfolio metrics and data
+    
+    Returns:
+        str: Context block for the system prompt
+    """
+    return CONTEXT_PROMPT_TEMPLATE.format(
+        total_value=portfolio_context.get('total_value', 0),
+        risk_level=portfolio_context.get('risk_level', 'Unknown'),
+        sharpe_ratio=portfolio_context.get('sharpe_ratio', 'N/A'),
+        volatility=portfolio_context.get('volatility', 'N/A'),
+        diversification_score=portfolio_context.get('diversification_score', 'N/A'),
+        num_holdings=portfolio_context.get('num_holdings', 0)
+    )
+
+
 class PortfolioChatAssistant:
     """AI chat assistant for portfolio analysis"""
     
@@ -20,46 +129,109 @@ class PortfolioChatAssistant:
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
         
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = _get_client(api_key)
+        self._api_key = api_key
+        # Async client and history lock, created on first use for each event loop
+        self._async_loop = None
+        self._async_client = None
+        self._history_lock = None
         self.conversation_history = []
     
     def get_system_prompt(self, portfolio_context=None):
         """
         Generate system prompt with portfolio context
         
+        The static instructions come first and are marked for prompt caching,
+        so only the per-portfolio context block is processed fresh each turn.
+        
         Args:
             portfolio_context (dict): Current portfolio metrics and data
         
         Returns:
-            str: System prompt for Claude
+            list: System prompt content blocks for Claude
         """
-        base_prompt = """You are a professional financial advisor assistant helping retail banking clients understand their investment portfolios. 
-
-Your role:
-- Explain financial metrics in simple, accessible language
-- Provide actionable investment advice based on portfolio data
-- Help users understand risk, diversification, and rebalancing
-- Be encouraging but honest about risks
-- Cite specific numbers from their portfolio when relevant
-
-Keep responses concise (2-3 paragraphs max) unless asked for detailed analysis."""
-
+        system = [{
+            "type": "text",
+            "text": BASE_SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"}
+        }]
+        
         if portfolio_context:
-            context_str = f"""
-
-Current Portfolio Context:
-- Total Value: ${portfolio_context.get('total_value', 0):,.2f}
-- Risk Level: {portfolio_context.get('risk_level', 'Unknown')}
-- Sharpe Ratio: {portfolio_context.get('sharpe_ratio', 'N/A')}
-- Volatility: {portfolio_context.get('volatility', 'N/A')}
-- Diversification Score: {portfolio_context.get('diversification_score', 'N/A')}/10
-- Number of Holdings: {portfolio_context.get('num_holdings', 0)}
-
-Use this context to provide personalized advice."""
-            
-            return base_prompt + context_str
+            system.append({"type": "text", "text": _format_context(portfolio_context)})
+        
+        return system
+    
+    def get_messages(self, conversation=None):
+        """
+        Build the messages payload with prompt-cache breakpoints
+        
+        The newest message and the previous user turn are marked for caching,
+        so each turn reuses the cached prefix of the conversation so far.
+        Only these two breakpoints are ever set; older turns are sent as
+        plain text.
+        
+        Args:
+            conversation (list): Messages to send. If None, the conversation history
         
-        return base_prompt
+        Returns:
+            list: Conversation history formatted for Claude
+        """
+        if conversation is None:
+            conversation = self.conversation_history
+        
+        messages = [dict(message) for message in conversation]
+        if not messages:
+            return messages
+        
+        user_indices = [i for i, m in enumerate(messages) if m["role"] == "user"]
+        breakpoints = {len(messages) - 1, *user_indices[-2:-1]}
+        
+        for i in sorted(breakpoints)[-HISTORY_CACHE_BREAKPOINTS:]:
+            messages[i]["content"] = [{
+                "type": "text",
+                "text": messages[i]["content"],
+                "cache_control": {"type": "ephemeral"}
+            }]
+        
+        return messages
+    
+    def get_cached_response(self, user_message, portfolio_context=None):
+        """
+        Look up an earlier answer, from any assistant, to the same question about the same portfolio
+        
+        Only questions that open a conversation are answered from the cache;
+        follow-ups depend on the turns before them.
+        
+        Args:
+            user_message (str): User's question
+            portfolio_context (dict): Current portfolio data
+        
+        Returns:
+            str: Cached response, or None on a miss
+        """
+        if self.conversation_history:
+            return None
+        
+        with _response_cache_lock:
+            return _response_cache.get(_response_cache_key(user_message, portfolio_context))
+    
+    def cache_response(self, user_message, portfolio_context, response):
+        """
+        Store the answer to a question that opened a conversation, for all assistants
+        
+        Args:
+            user_message (str): User's question
+            portfolio_context (dict): Portfolio data the answer was given for
+            response (str): Claude's response
+        """
+        key = _response_cache_key(user_message, portfolio_context)
+        
+        with _response_cache_lock:
+            _response_cache[key] = response
+            
+            # Drop the oldest entry once the cache is full
+            if len(_response_cache) > RESPONSE_CACHE_SIZE:
+                del _response_cache[next(iter(_response_cache))]
     
     def chat(self, user_message, portfolio_context=None):
         """
@@ -73,37 +245,202 @@ Use this context to provide personalized advice."""
             str: Claude's response
         """
         try:
+            cached_response = self.get_cached_response(user_message, portfolio_context)
+            opens_conversation = not self.conversation_history
+            
             # Add user message to history
             self.conversation_history.append({
                 "role": "user",
                 "content": user_message
             })
             
+            # Answer repeated questions without calling the API
+            if cached_response is not None:
+                self._record_reply(cached_response)
+                return cached_response
+            
             # Get system prompt with context
             system_prompt = self.get_system_prompt(portfolio_context)
             
             # Call Claude API
             response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1024,
+                model=MODEL,
+                max_tokens=MAX_TOKENS,
                 system=system_prompt,
-                messages=self.conversation_history
+                messages=self.get_messages()
             )
             
             # Extract response text
             assistant_message = response.content[0].text
             
             # Add to history
+            self._record_reply(assistant_message)
+            
+            if opens_conversation:
+                self.cache_response(user_message, portfolio_context, assistant_message)
+            
+            return assistant_message
+        
+        except Exception as e:
+            return f"Error: Unable to get response from AI assistant. {str(e)}"
+    
+    def chat_stream(self, user_message, portfolio_context=None):
+        """
+        Send message to Claude and stream the response as it is generated
+        
+        Args:
+            user_message (str): User's question
+            portfolio_context (dict): Current portfolio data
+        
+        Yields:
+            str: Chunks of Claude's response text
+        """
+        try:
+            cached_response = self.get_cached_response(user_message, portfolio_context)
+            opens_conversation = not self.conversation_history
+            
+            # Add user message to history
             self.conversation_history.append({
-                "role": "assistant",
-                "content": assistant_message
+                "role": "user",
+                "content": user_message
             })
             
+            # Answer repeated questions without calling the API
+            if cached_response is not None:
+                self._record_reply(cached_response)
+                yield cached_response
+                return
+            
+            # Get system prompt with context
+            system_prompt = self.get_system_prompt(portfolio_context)
+            
+            with self.client.messages.stream(
+                model=MODEL,
+                max_tokens=MAX_TOKENS,
+                system=system_prompt,
+                messages=self.get_messages()
+            ) as stream:
+                for text in stream.text_stream:
+                    yield text
+                
+                final_message = stream.get_final_message()
+            
+            # Add the complete response to history
+            assistant_message = "".join(
+                block.text for block in final_message.content if block.type == "text"
+            )
+            self._record_reply(assistant_message)
+            
+            if opens_conversation:
+                self.cache_response(user_message, portfolio_context, assistant_message)
+        
+        except Exception as e:
+            # Drop the unanswered question so the history keeps alternating turns
+            if self.conversation_history and self.conversation_history[-1]["role"] == "user":
+                self.conversation_history.pop()
+            
+            yield f"\n\nError: Unable to get response from AI assistant. {str(e)}"
+    
+    def _get_async_resources(self):
+        """
+        Async client and history lock bound to the running event loop
+        
+        Both belong to the loop that created them, so they are rebuilt whenever
+        chat_async runs on a new loop (e.g. successive asyncio.run calls).
+        
+        Returns:
+            tuple: (anthropic.AsyncAnthropic, asyncio.Lock)
+        """
+        loop = asyncio.get_running_loop()
+        
+        if self._async_loop is not loop:
+            self._async_loop = loop
+            self._async_client = anthropic.AsyncAnthropic(
+                api_key=self._api_key,
+                max_retries=API_MAX_RETRIES,
+                timeout=API_TIMEOUT
+            )
+            self._history_lock = asyncio.Lock()
+        
+        return self._async_client, self._history_lock
+    
+    async def chat_async(self, user_message, portfolio_context=None):
+        """
+        Send message to Claude without blocking, so several calls can run concurrently
+        
+        Args:
+            user_message (str): User's question
+            portfolio_context (dict): Current portfolio data
+        
+        Returns:
+            str: Claude's response
+        """
+        try:
+            async_client, history_lock = self._get_async_resources()
+            user_entry = {"role": "user", "content": user_message}
+            
+            async with history_lock:
+                cached_response = self.get_cached_response(user_message, portfolio_context)
+                opens_conversation = not self.conversation_history
+                
+                # Answer repeated questions without calling the API
+                if cached_response is not None:
+                    self.conversation_history.append(user_entry)
+                    self._record_reply(cached_response)
+                    return cached_response
+                
+                # Snapshot the conversation; history is only updated once the reply arrives
+                messages = self.get_messages(self.conversation_history + [user_entry])
+            
+            # Call Claude API
+            response = await async_client.messages.create(
+                model=MODEL,
+                max_tokens=MAX_TOKENS,
+                system=self.get_system_prompt(portfolio_context),
+                messages=messages
+            )
+            
+            # Extract response text
+            assistant_message = response.content[0].text
+            
+            # Add the question and answer to history together so concurrent
+            # calls never interleave their turns
+            async with history_lock:
+                self.conversation_history.append(user_entry)
+                self._record_reply(assistant_message)
+                
+                if opens_conversation:
+                    self.cache_response(user_message, portfolio_context, assistant_message)
+            
             return assistant_message
         
         except Exception as e:
             return f"Error: Unable to get response from AI assistant. {str(e)}"
     
+    def _record_reply(self, assistant_message):
+        """
+        Add an assistant reply to the history and keep the history bounded
+        
+        Once the history exceeds MAX_HISTORY_TURNS turns it is cut back to the
+        newest half of the window. Trimming in steps rather than by one turn
+        each call keeps the cached conversation prefix stable between trims.
+        
+        Args:
+            assistant_message (str): Claude's response
+        """
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": assistant_message
+        })
+        
+        if len(self.conversation_history) > 2 * MAX_HISTORY_TURNS:
+            keep = 2 * (MAX_HISTORY_TURNS // 2)
+            self.conversation_history = self.conversation_history[-keep:]
+            
+            # The API expects the conversation to open with a user turn
+            while self.conversation_history and self.conversation_history[0]["role"] != "user":
+                self.conversation_history.pop(0)
+    
     def reset_conversation(self):
         """Clear conversation history"""
         self.conversation_history = []
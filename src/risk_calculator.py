@@ -7,6 +7,123 @@ import pandas as pd
 import numpy as np
 from scipy import stats
 
+
+def _max_drawdown(prices):
+    """
+    Maximum drawdown of a price (or equity) array
+    
+    Works on prices directly: the running peak of the prices is the running
+    peak of cumulative returns scaled by the first price, so no returns or
+    cumulative product need to be built. NaN prices are skipped.
+    
+    Args:
+        prices (np.ndarray): Contiguous float64 prices
+    
+    Returns:
+        float: Maximum drawdown as a positive fraction
+    """
+    running_max = np.fmax.accumulate(prices)
+    
+    return abs(np.nanmin(prices / running_max - 1))
+
+
+def _drawdown_from_returns(returns):
+    """
+    Maximum drawdown of the equity curve implied by a daily returns array
+    
+    The curve starts at an equity of 1.0, so a loss on the first day counts
+    as a drawdown, as it does for prices in _max_drawdown.
+    
+    Args:
+        returns (np.ndarray): Contiguous float64 daily returns
+    
+    Returns:
+        float: Maximum drawdown as a positive fraction
+    """
+    if not len(returns):
+        return 0.0
+    
+    equity = np.empty(len(returns) + 1)
+    equity[0] = 1.0
+    np.cumprod(1 + returns, out=equity[1:])
+    
+    return _max_drawdown(equity)
+
+
+def _annualize(mean, std, risk_free_rate):
+    """
+    Annualize a daily mean and standard deviation
+    
+    Args:
+        mean (float): Mean daily return
+        std (float): Sample standard deviation of daily returns
+        risk_free_rate (float): Annual risk-free rate
+    
+    Returns:
+        tuple: (annual_return, annual_volatility, sharpe_ratio)
+    """
+    annual_return = mean * 252
+    annual_volatility = std * np.sqrt(252)
+    
+    return annual_return, annual_volatility, (annual_return - risk_free_rate) / annual_volatility
+
+
+def _return_vol_sharpe(returns, risk_free_rate):
+    """
+    Annualized return, volatility and Sharpe ratio of a daily returns array
+    
+    The mean is computed once and reused for the variance, so return,
+    volatility and Sharpe ratio all come from the same two passes.
+    
+    Args:
+        returns (np.ndarray): Contiguous float64 daily returns without NaN
+        risk_free_rate (float): Annual risk-free rate
+    
+    Returns:
+        tuple: (annual_return, annual_volatility, sharpe_ratio)
+    """
+    n = len(returns)
+    
+    if n < 2:
+        # Same as pandas: the std of fewer than two points is undefined
+        return _annualize(returns.mean() if n else np.nan, np.nan, risk_free_rate)
+    
+    mean = returns.mean()
+    deviations = returns - mean
+    std = np.sqrt(deviations @ deviations / (n - 1))
+    
+    return _annualize(mean, std, risk_free_rate)
+
+
+def _valid_returns(returns):
+    """
+    Float64 array of returns with missing values removed
+    
+    Args:
+        returns (pd.Series or np.ndarray): Daily returns
+    
+    Returns:
+        np.ndarray: Contiguous float64 returns without NaN
+    """
+    values = np.asarray(returns, dtype=np.float64)
+    
+    return values[~np.isnan(values)]
+
+
+def _risk_kernel(returns, risk_free_rate):
+    """
+    Annualized return, volatility, Sharpe ratio and maximum drawdown of a daily returns array
+    
+    Args:
+        returns (np.ndarray): Contiguous float64 daily returns
+        risk_free_rate (float): Annual risk-free rate
+    
+    Returns:
+        tuple: (annual_return, annual_volatility, sharpe_ratio, max_drawdown)
+    """
+    return _return_vol_sharpe(returns, risk_free_rate) + (_drawdown_from_returns(returns),)
+
+
 class RiskCalculator:
     """Calculates various risk metrics for portfolio analysis"""
     
@@ -29,7 +146,19 @@ class RiskCalculator:
         Returns:
             pd.Series or pd.DataFrame: Daily returns
         """
-        return prices.pct_change().dropna()
+        values = prices.to_numpy(dtype=np.float64)
+        returns = values[1:] / values[:-1] - 1
+        
+        if isinstance(prices, pd.DataFrame):
+            result = pd.DataFrame(returns, index=prices.index[1:], columns=prices.columns)
+        else:
+            result = pd.Series(returns, index=prices.index[1:], name=prices.name)
+        
+        # Only gaps in the prices leave missing returns to drop
+        if np.isnan(returns).any():
+            result = result.dropna()
+        
+        return result
     
     def calculate_volatility(self, returns, annualize=True):
         """
@@ -42,11 +171,11 @@ class RiskCalculator:
         Returns:
             float: Volatility (annualized if specified)
         """
-        volatility = returns.std()
+        _, volatility, _ = _return_vol_sharpe(_valid_returns(returns), self.risk_free_rate)
         
-        if annualize:
-            # Annualize using 252 trading days
-            volatility = volatility * np.sqrt(252)
+        if not annualize:
+            # Back to daily (annualized using 252 trading days)
+            volatility = volatility / np.sqrt(252)
         
         return volatility
     
@@ -61,16 +190,13 @@ class RiskCalculator:
         Returns:
             float: Sharpe ratio
         """
-        mean_return = returns.mean()
-        std_return = returns.std()
-        
-        if annualize:
-            # Annualize mean and std
-            mean_return = mean_return * 252
-            std_return = std_return * np.sqrt(252)
+        mean_return, std_return, sharpe = _return_vol_sharpe(
+            _valid_returns(returns), self.risk_free_rate
+        )
         
-        # Sharpe ratio = (Return - Risk Free Rate) / Volatility
-        sharpe = (mean_return - self.risk_free_rate) / std_return
+        if not annualize:
+            # Sharpe ratio = (Return - Risk Free Rate) / Volatility, on daily figures
+            sharpe = (mean_return / 252 - self.risk_free_rate) / (std_return / np.sqrt(252))
         
         return sharpe
     
@@ -85,18 +211,35 @@ class RiskCalculator:
         Returns:
             float: Beta value
         """
-        # Align the returns
-        aligned_data = pd.DataFrame({
-            'stock': stock_returns,
-            'market': market_returns
-        }).dropna()
+        # Too few observations for a covariance
+        if len(stock_returns) < 2 or len(market_returns) < 2:
+            return None
+        
+        # Align the returns on common dates and drop missing values
+        stock_aligned, market_aligned = stock_returns.align(market_returns, join='inner')
+        stock_values = stock_aligned.to_numpy(dtype=np.float64)
+        market_values = market_aligned.to_numpy(dtype=np.float64)
         
-        if len(aligned_data) < 2:
+        valid = ~(np.isnan(stock_values) | np.isnan(market_values))
+        
+        if valid.sum() < 2:
+            return None
+        
+        stock_values = stock_values[valid]
+        market_values = market_values[valid]
+        
+        # A flat market series has no defined beta. Checked on the values, since
+        # the computed variance of e.g. [.1, .1, .1] is a tiny non-zero number
+        if np.ptp(market_values) == 0:
             return None
         
-        # Calculate covariance and variance
-        covariance = aligned_data['stock'].cov(aligned_data['market'])
-        market_variance = aligned_data['market'].var()
+        # Covariance and market variance from one 2x2 covariance matrix
+        covariance_matrix = np.cov(stock_values, market_values, ddof=1)
+        covariance = covariance_matrix[0, 1]
+        market_variance = covariance_matrix[1, 1]
+        
+        if np.isnan(market_variance):
+            return None
         
         beta = covariance / market_variance
         
@@ -114,7 +257,20 @@ class RiskCalculator:
             float: VaR value (positive number representing potential loss)
         """
         # Using historical method
-        var = np.percentile(returns, (1 - confidence_level) * 100)
+        returns = np.asarray(returns, dtype=np.float64)
+        returns = returns[~np.isnan(returns)]
+        
+        if returns.size == 0:
+            return None
+        
+        # Same linear interpolation as np.percentile, but selecting only the
+        # two neighbouring order statistics with one O(n) partition
+        position = (1 - confidence_level) * (returns.size - 1)
+        lower = int(position)
+        upper = min(lower + 1, returns.size - 1)
+        
+        partitioned = np.partition(returns, (lower, upper))
+        var = partitioned[lower] + (partitioned[upper] - partitioned[lower]) * (position - lower)
         
         return abs(var)
     
@@ -128,58 +284,119 @@ class RiskCalculator:
         Returns:
             float: Maximum drawdown as a percentage
         """
-        # Calculate cumulative returns
-        cumulative = (1 + self.calculate_returns(prices)).cumprod()
+        prices = np.ascontiguousarray(np.asarray(prices, dtype=np.float64))
+        
+        if len(prices) < 2:
+            return 0.0
+        
+        return _max_drawdown(prices)
+    
+    def calculate_max_drawdown_from_returns(self, returns):
+        """
+        Calculate Maximum Drawdown directly from a daily returns array
+        
+        Args:
+            returns (np.ndarray): Daily returns
+        
+        Returns:
+            float: Maximum drawdown as a percentage
+        """
+        return _drawdown_from_returns(np.ascontiguousarray(returns, dtype=np.float64))
+    
+    def prepare(self, portfolio_data):
+        """
+        Stack the Close columns of portfolio data into one price matrix
         
-        # Calculate running maximum
-        running_max = cumulative.expanding().max()
+        Prices are aligned on dates; a ticker missing a date gets NaN there.
+        The result can be passed to calculate_portfolio_metrics repeatedly
+        without re-stacking the per-ticker DataFrames.
         
-        # Calculate drawdown
-        drawdown = (cumulative - running_max) / running_max
+        Args:
+            portfolio_data (dict): Dictionary with ticker as key, price data as value
         
-        max_drawdown = drawdown.min()
+        Returns:
+            tuple: (closes of shape (T, N) as float64 np.ndarray, list of N tickers)
+        """
+        closes = self._stack_closes(portfolio_data)
         
-        return abs(max_drawdown)
+        return closes.to_numpy(dtype=np.float64), list(closes.columns)
+    
+    def _stack_closes(self, portfolio_data):
+        """Date-aligned DataFrame of the Close column of each ticker"""
+        return pd.concat(
+            {ticker: data['Close'] for ticker, data in portfolio_data.items()
+             if 'Close' in data.columns},
+            axis=1
+        )
     
     def calculate_portfolio_metrics(self, portfolio_data, weights=None):
         """
         Calculate comprehensive risk metrics for entire portfolio
         
         Args:
-            portfolio_data (dict): Dictionary with ticker as key, price data as value
+            portfolio_data (dict or tuple): Dictionary with ticker as key, price data
+                as value, or the (closes, tickers) tuple returned by prepare()
             weights (dict): Portfolio weights {ticker: weight}. If None, equal weights
         
         Returns:
             dict: Dictionary of portfolio metrics
         """
-        tickers = list(portfolio_data.keys())
+        if isinstance(portfolio_data, tuple):
+            closes, tickers = portfolio_data
+        else:
+            closes, tickers = self.prepare(portfolio_data)
         
         # Default to equal weights if not provided
         if weights is None:
             weights = {ticker: 1/len(tickers) for ticker in tickers}
         
-        # Calculate returns for each stock
-        returns_data = {}
-        for ticker, data in portfolio_data.items():
-            if 'Close' in data.columns:
-                returns_data[ticker] = self.calculate_returns(data['Close'])
+        # Daily returns of every ticker and weighted portfolio returns as matrix ops
+        returns = closes[1:] / closes[:-1] - 1
+        weight_vector = np.array(
+            [weights.get(ticker, 0) for ticker in tickers],
+            dtype=np.float64
+        )
+        weighted_returns = returns @ weight_vector
         
-        # Create returns DataFrame
-        returns_df = pd.DataFrame(returns_data)
+        valid = ~np.isnan(weighted_returns)
+        clean_returns = weighted_returns[valid]
         
-        # Calculate weighted portfolio returns
-        weighted_returns = sum(returns_df[ticker] * weights[ticker] 
-                              for ticker in tickers if ticker in returns_df.columns)
+        annual_return, volatility, sharpe_ratio = _return_vol_sharpe(
+            clean_returns, self.risk_free_rate
+        )
         
         # Calculate metrics
         metrics = {
-            'annual_return': weighted_returns.mean() * 252,
-            'volatility': self.calculate_volatility(weighted_returns),
-            'sharpe_ratio': self.calculate_sharpe_ratio(weighted_returns),
-            'var_95': self.calculate_var(weighted_returns, 0.95),
-            'max_drawdown': self.calculate_max_drawdown(
-                (1 + weighted_returns).cumprod()
-            )
+            'annual_return': annual_return,
+            'volatility': volatility,
+            'sharpe_ratio': sharpe_ratio,
+            'var_95': self.calculate_var(clean_returns, 0.95),
+            'max_drawdown': _drawdown_from_returns(clean_returns)
+        }
+        
+        return metrics
+    
+    def calculate_portfolio_metrics_vec(self, portfolio_returns):
+        """
+        Calculate portfolio risk metrics from a precomputed daily returns array
+        
+        Args:
+            portfolio_returns (np.ndarray): Daily portfolio returns, shape (T,)
+        
+        Returns:
+            dict: Dictionary of portfolio metrics
+        """
+        portfolio_returns = np.ascontiguousarray(portfolio_returns, dtype=np.float64)
+        annual_return, volatility, sharpe_ratio, max_drawdown = _risk_kernel(
+            portfolio_returns, self.risk_free_rate
+        )
+        
+        metrics = {
+            'annual_return': annual_return,
+            'volatility': volatility,
+            'sharpe_ratio': sharpe_ratio,
+            'var_95': self.calculate_var(portfolio_returns, 0.95),
+            'max_drawdown': max_drawdown
         }
         
         return metrics